@@ -4,6 +4,7 @@
 Script to create a GitHub repository and push the code
 """
 
+import asyncio
 import os
 import subprocess
 import sys
@@ -21,26 +22,39 @@ def check_github_cli():
     except FileNotFoundError:
         return False
 
-def create_with_gh_cli():
+async def run_command(*cmd, capture_output=False, check=False):
+    """Run a command without blocking the event loop, returning (returncode, stdout)"""
+    stdout = asyncio.subprocess.PIPE if capture_output else None
+    stderr = asyncio.subprocess.PIPE if capture_output else None
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=stdout, stderr=stderr)
+    out, _ = await process.communicate()
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, list(cmd))
+    return process.returncode, (out or b'').decode().strip()
+
+async def create_with_gh_cli():
     """Create repo using GitHub CLI"""
     print("Using GitHub CLI to create repository...")
+    # Look up the username while the repo is being created
+    username_task = asyncio.create_task(
+        run_command('gh', 'api', 'user', '--jq', '.login', capture_output=True))
     try:
-        subprocess.run(['gh', 'repo', 'create', REPO_NAME, 
-                       '--public', 
-                       '--description', DESCRIPTION,
-                       '--source', '.',
-                       '--remote', 'origin',
-                       '--push'], check=True)
+        await run_command('gh', 'repo', 'create', REPO_NAME, 
+                          '--public', 
+                          '--description', DESCRIPTION,
+                          '--source', '.',
+                          '--remote', 'origin',
+                          '--push', check=True)
         print(f"✅ Repository created and pushed!")
-        username = subprocess.run(['gh', 'api', 'user', '--jq', '.login'],
-                                 capture_output=True, text=True).stdout.strip()
+        _, username = await username_task
         print(f"View at: https://github.com/{username}/{REPO_NAME}")
         return True
     except subprocess.CalledProcessError as e:
+        username_task.cancel()
         print(f"❌ Error: {e}")
         return False
 
-def create_with_api():
+async def create_with_api():
     """Create repo using GitHub API"""
     token = os.getenv('GITHUB_TOKEN')
     if not token:
@@ -68,12 +82,13 @@ def create_with_api():
             repo_data = json.loads(response.read())
             username = repo_data['owner']['login']
             
-            # Add remote and push
-            subprocess.run(['git', 'remote', 'add', 'origin', 
-                          f'https://github.com/{username}/{REPO_NAME}.git'],
-                         capture_output=True)
-            subprocess.run(['git', 'branch', '-M', 'main'], check=True)
-            subprocess.run(['git', 'push', '-u', 'origin', 'main'], check=True)
+            # Add remote and push. These stay sequential: remote add and
+            # branch -M both take the .git/config lock.
+            await run_command('git', 'remote', 'add', 'origin', 
+                              f'https://github.com/{username}/{REPO_NAME}.git',
+                              capture_output=True)
+            await run_command('git', 'branch', '-M', 'main', check=True)
+            await run_command('git', 'push', '-u', 'origin', 'main', check=True)
             
             print(f"✅ Repository created and pushed!")
             print(f"View at: https://github.com/{username}/{REPO_NAME}")
@@ -97,12 +112,12 @@ def main():
     
     # Try GitHub CLI first
     if check_github_cli():
-        if create_with_gh_cli():
+        if asyncio.run(create_with_gh_cli()):
             return
         print("\nGitHub CLI failed, trying API...\n")
     
     # Try API
-    if create_with_api():
+    if asyncio.run(create_with_api()):
         return
     
     # Manual instructions
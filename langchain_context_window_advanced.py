@@ -12,29 +12,66 @@ Note: Requires OPENAI_API_KEY environment variable to be set
 """
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
+from langchain.schema import Document, HumanMessage
 from langchain.llms import OpenAI
 from langchain.chat_models import ChatOpenAI
 from langchain.callbacks import get_openai_callback
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
+from functools import lru_cache
 import tiktoken
+import asyncio
 import os
+import re
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model):
+    """Return a cached tiktoken encoding for the given model"""
+    return tiktoken.encoding_for_model(model)
+
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def _estimate_tokens(text):
+    """Estimate ~1.3 tokens per word without building a list of words"""
+    word_count = sum(1 for _ in _WORD_RE.finditer(text))
+    return int(word_count * 1.3)
 
 
 def count_tokens(text, model="gpt-3.5-turbo"):
-    """Accurately count tokens using tiktoken"""
+    """Accurately count tokens using tiktoken
+
+    Accepts a single string or a list of strings. Lists are tokenized in one
+    encode_batch call and a list of counts is returned.
+    """
     try:
-        encoding = tiktoken.encoding_for_model(model)
-        tokens = encoding.encode(text)
-        return len(tokens)
+        encoding = _get_encoding(model)
+        if isinstance(text, str):
+            return len(encoding.encode(text))
+        token_lists = encoding.encode_batch(text, num_threads=os.cpu_count() or 1)
+        return [len(tokens) for tokens in token_lists]
     except Exception as e:
         # Fallback: rough estimate
-        return int(len(text.split()) * 1.3)
+        if isinstance(text, str):
+            return _estimate_tokens(text)
+        return [_estimate_tokens(t) for t in text]
+
 
+@lru_cache(maxsize=None)
+def _get_splitter(chunk_size, chunk_overlap):
+    """Return a shared RecursiveCharacterTextSplitter for the given sizes"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len
+    )
 
+
+@lru_cache(maxsize=None)
 def create_large_document():
-    """Create a document that exceeds context window"""
+    """Create a document that exceeds context window (built once and cached)"""
     base_text = """
     The context window problem is one of the most significant challenges in working
     with Large Language Models (LLMs). A context window refers to the maximum number
@@ -93,13 +130,14 @@ def demonstrate_token_limits():
     return large_text, token_count
 
 
-def demonstrate_splitting_strategy():
+def demonstrate_splitting_strategy(large_text=None):
     """Show how to split documents to fit context window"""
     print("\n" + "=" * 80)
     print("SPLITTING STRATEGY")
     print("=" * 80)
     
-    large_text = create_large_document()
+    if large_text is None:
+        large_text = create_large_document()
     
     # Calculate appropriate chunk size
     # Leave room for prompt and response (typically 1000-2000 tokens)
@@ -118,25 +156,38 @@ def demonstrate_splitting_strategy():
     print(f"  - Available for chunk: {available_for_chunk:,} tokens")
     print(f"  - Recommended chunk size: ~{chunk_size_chars:,} characters")
     
-    # Split the document
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size_chars,
-        chunk_overlap=200,  # 200 chars overlap for context
-        length_function=len
-    )
+    # Split the document (200 chars overlap for context)
+    text_splitter = _get_splitter(chunk_size_chars, 200)
     
     chunks = text_splitter.split_text(large_text)
     
     print(f"\nSplitting Results:")
     print(f"  - Number of chunks: {len(chunks)}")
-    for i, chunk in enumerate(chunks[:5], 1):
-        chunk_tokens = count_tokens(chunk)
+    # Only the displayed chunks are tokenized, in one batch
+    preview = chunks[:5]
+    chunk_token_counts = count_tokens(preview)
+    for i, (chunk, chunk_tokens) in enumerate(zip(preview, chunk_token_counts), 1):
         print(f"  - Chunk {i}: {len(chunk):,} chars, ~{chunk_tokens:,} tokens")
     
     return chunks
 
 
-def demonstrate_processing_with_llm(api_key_set=False):
+async def summarize_chunks(llm, chunks, max_concurrency=8):
+    """Summarize chunks concurrently, returning (summary, tokens) or an exception per chunk"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def summarize(chunk):
+        prompt = f"Provide a brief summary (2-3 sentences) of the following text:\n\n{chunk}"
+        async with semaphore:
+            # Each task runs in its own context, so callbacks don't mix token counts
+            with get_openai_callback() as cb:
+                response = await llm.ainvoke([HumanMessage(content=prompt)])
+        return response.content, cb.total_tokens
+    
+    return await asyncio.gather(*(summarize(chunk) for chunk in chunks), return_exceptions=True)
+
+
+def demonstrate_processing_with_llm(api_key_set=False, large_text=None, chunks=None):
     """Demonstrate processing chunks with an LLM"""
     print("\n" + "=" * 80)
     print("PROCESSING WITH LLM")
@@ -173,28 +224,30 @@ def demonstrate_processing_with_llm(api_key_set=False):
     try:
         llm = ChatOpenAI(temperature=0, model_name="gpt-3.5-turbo")
         
-        large_text = create_large_document()
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=3000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_text(large_text)
+        # Reuse chunks from the splitting demo rather than splitting again
+        if chunks is None:
+            if large_text is None:
+                large_text = create_large_document()
+            chunks = _get_splitter(3000, 200).split_text(large_text)
         
         print(f"\nProcessing {len(chunks)} chunks...")
         
         total_tokens = 0
         summaries = []
         
-        for i, chunk in enumerate(chunks[:3], 1):  # Process first 3 chunks as example
-            prompt = f"Provide a brief summary (2-3 sentences) of the following text:\n\n{chunk}"
-            
-            with get_openai_callback() as cb:
-                response = llm.predict(prompt)
-                total_tokens += cb.total_tokens
+        # Process first 3 chunks as example, concurrently
+        results = asyncio.run(summarize_chunks(llm, chunks[:3]))
+        
+        for i, result in enumerate(results, 1):
+            print(f"\nChunk {i}:")
+            if isinstance(result, Exception):
+                print(f"  - Error: {result}")
+                continue
             
+            response, chunk_tokens = result
+            total_tokens += chunk_tokens
             summaries.append(response)
-            print(f"\nChunk {i}:")
-            print(f"  - Tokens used: {cb.total_tokens}")
+            print(f"  - Tokens used: {chunk_tokens}")
             print(f"  - Summary: {response[:200]}...")
         
         print(f"\nTotal tokens used for {len(chunks)} chunks: {total_tokens:,}")
@@ -272,8 +325,8 @@ def main():
     
     # Run demonstrations
     large_text, token_count = demonstrate_token_limits()
-    chunks = demonstrate_splitting_strategy()
-    demonstrate_processing_with_llm(api_key_set)
+    chunks = demonstrate_splitting_strategy(large_text)
+    demonstrate_processing_with_llm(api_key_set, large_text, chunks)
     demonstrate_rag_workflow()
     
     print("\n" + "=" * 80)
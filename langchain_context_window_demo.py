@@ -13,14 +13,16 @@ from langchain.schema import Document
 from langchain.llms import OpenAI
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
+from functools import lru_cache
 import os
 
 # Note: This is a demonstration. In production, use environment variables for API keys
 # os.environ["OPENAI_API_KEY"] = "your-api-key-here"
 
 
+@lru_cache(maxsize=None)
 def create_large_document():
-    """Create a large document that exceeds typical context windows"""
+    """Create a large document that exceeds typical context windows (built once and cached)"""
     # Simulating a large document by repeating content
     base_text = """
     Artificial Intelligence (AI) has revolutionized the way we interact with technology.
@@ -57,15 +59,17 @@ def demonstrate_context_window_problem():
     large_text = create_large_document()
     document = Document(page_content=large_text)
     
+    word_count = len(large_text.split())
+    estimated_tokens = word_count * 1.3
+    
     print(f"\n1. Document Statistics:")
     print(f"   - Character count: {len(large_text):,}")
-    print(f"   - Approximate word count: {len(large_text.split()):,}")
-    print(f"   - Approximate token count (rough estimate): ~{len(large_text.split()) * 1.3:.0f}")
+    print(f"   - Approximate word count: {word_count:,}")
+    print(f"   - Approximate token count (rough estimate): ~{estimated_tokens:.0f}")
     print(f"   - Typical GPT-3.5 context window: 4,096 tokens")
     print(f"   - Typical GPT-4 context window: 8,192 tokens (or 32,768 for extended)")
     
     # Check if document exceeds context window
-    estimated_tokens = len(large_text.split()) * 1.3
     if estimated_tokens > 4096:
         print(f"\n   ⚠️  PROBLEM: Document exceeds typical context window!")
         print(f"   The document is too large to process in a single API call.")
@@ -75,13 +79,14 @@ def demonstrate_context_window_problem():
     return document
 
 
-def demonstrate_text_splitting():
+def demonstrate_text_splitting(large_text=None):
     """Demonstrate how to split large documents using LangChain"""
     print("\n" + "=" * 80)
     print("SOLUTION: TEXT SPLITTING WITH LANGCHAIN")
     print("=" * 80)
     
-    large_text = create_large_document()
+    if large_text is None:
+        large_text = create_large_document()
     
     # Method 1: Recursive Character Text Splitter (Recommended)
     print("\n2. Using RecursiveCharacterTextSplitter:")
@@ -115,13 +120,14 @@ def demonstrate_text_splitting():
     return chunks
 
 
-def demonstrate_document_processing():
+def demonstrate_document_processing(large_text=None):
     """Demonstrate processing documents with LangChain"""
     print("\n" + "=" * 80)
     print("PROCESSING SPLIT DOCUMENTS")
     print("=" * 80)
     
-    large_text = create_large_document()
+    if large_text is None:
+        large_text = create_large_document()
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200
@@ -202,8 +208,8 @@ def main():
     
     # Run demonstrations
     document = demonstrate_context_window_problem()
-    chunks = demonstrate_text_splitting()
-    documents = demonstrate_document_processing()
+    chunks = demonstrate_text_splitting(document.page_content)
+    documents = demonstrate_document_processing(document.page_content)
     demonstrate_rag_approach()
     demonstrate_token_counting()
     
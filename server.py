@@ -1,44 +1,202 @@
 # Author: Naveen Chintala
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional
+from collections import OrderedDict
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import bisect
+import hashlib
+import httpx
 import tiktoken
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+import orjson
 import os
+from pathlib import Path
+import threading
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_community.callbacks import get_openai_callback
-from langchain_core.messages import HumanMessage, SystemMessage
 
 # Load environment variables
 load_dotenv()
 
+# Read once at import; these don't change while the server is running
+_ENV_OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+_FRONTEND_DIR = Path("frontend/dist")
+MAX_INPUT_CHARS = int(os.getenv("MAX_INPUT_CHARS", 5_000_000))
+# The frontend calls http://localhost:8000 directly, so the server's own origins
+# must be allowed as well as the Vite dev server's
+_DEFAULT_CORS_ORIGINS = ",".join([
+    "http://localhost:5173",
+    "http://127.0.0.1:5173",
+    "http://localhost:8000",
+    "http://127.0.0.1:8000",
+])
+_CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", _DEFAULT_CORS_ORIGINS).split(",")
+    if origin.strip()
+]
+
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 
 app = FastAPI(title="LangChain Context Window Demo API")
 
-# Configure CORS
+# Configure CORS (defaults to the Vite dev server and this server); preflights are cached for a day
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=_CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
+    max_age=86400,
 )
 
+# Compress larger responses (split chunks are highly repetitive text)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+@lru_cache(maxsize=32)
+def _get_encoding(model: str):
+    # encoding_for_model does a registry lookup (and may load BPE data) on
+    # every call; the returned Encoding is immutable, so reuse it.
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Unknown to tiktoken (e.g. claude-3-opus): cl100k_base is a close proxy
+        return tiktoken.get_encoding("cl100k_base")
+
+# "tiktoken" (default, exact OpenAI BPE) or "tokenizers" (HuggingFace, faster
+# for count-only use)
+_TOKENIZER_BACKEND = os.getenv("TOKENIZER_BACKEND", "tiktoken").lower()
+
+class _HFEncoding:
+    """Adapts a HuggingFace Tokenizer to the tiktoken calls used for counting"""
+    def __init__(self, tokenizer):
+        self._tokenizer = tokenizer
+
+    def encode_ordinary(self, text: str) -> List[int]:
+        return self._tokenizer.encode(text, add_special_tokens=False).ids
+
+    def encode_ordinary_batch(self, texts: List[str], num_threads: Optional[int] = None) -> List[List[int]]:
+        # tokenizers parallelizes batches natively; num_threads is ignored
+        return [e.ids for e in self._tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+@lru_cache(maxsize=1)
+def _get_hf_encoding():
+    try:
+        from tokenizers import Tokenizer
+        return _HFEncoding(Tokenizer.from_pretrained("Xenova/gpt-3.5-turbo"))
+    except Exception as e:
+        print(f"Warning: tokenizers backend unavailable ({e}); using tiktoken.")
+        return None
+
+def _get_count_encoding(model: str):
+    # Encoding used only for counting; may be a faster non-tiktoken backend
+    if _TOKENIZER_BACKEND == "tokenizers":
+        encoding = _get_hf_encoding()
+        if encoding is not None:
+            return encoding
+    return _get_encoding(model)
+
+# Chunk lengths are measured in characters
+_SPLIT_LENGTH_FUNCTION = len
+
+@lru_cache(maxsize=64)
+def _get_splitter(chunk_size: int, chunk_overlap: int):
+    # Splitters hold no per-request state, so reuse one per parameter pair
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=_SPLIT_LENGTH_FUNCTION
+    )
+
+# One pooled HTTP client for all OpenAI calls so connections (and their TLS
+# sessions) are kept alive between requests. Created per lifespan.
+_http_client: Optional[httpx.AsyncClient] = None
+
+def _create_llm(api_key: str):
+    # Imported lazily so endpoints off the LLM path don't pay for langchain_openai
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        temperature=0,
+        model_name="gpt-3.5-turbo",
+        openai_api_key=api_key,
+        http_async_client=_http_client
+    )
+
+@lru_cache(maxsize=1)
+def _get_env_llm():
+    # Only the server's own key is cached; client-supplied keys are not kept
+    return _create_llm(_ENV_OPENAI_KEY)
+
+@app.on_event("startup")
+async def warm_encodings():
+    # Load BPE data before the first request instead of inside it. A failure
+    # (e.g. no network to fetch BPE files) must not stop the server; the
+    # encoding is simply loaded, and retried, on first use instead.
+    for model, _ in _MODEL_LIMITS:
+        try:
+            _get_count_encoding(model)
+        except Exception as e:
+            print(f"Warning: could not preload encoding for {model} ({e}); will retry on first use.")
+
+@app.on_event("startup")
+async def open_http_client():
+    global _http_client
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+    )
+    _get_env_llm.cache_clear()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    global _http_client
+    client, _http_client = _http_client, None
+    # Drop the cached LLM so it isn't left holding the closed client
+    _get_env_llm.cache_clear()
+    if client is not None:
+        await client.aclose()
+
+@app.on_event("startup")
+async def start_tokenize_pool():
+    global _TOKENIZE_POOL
+    # Default sizing (cores + 4, max 32) leaves spare threads so one long
+    # encode doesn't queue short requests behind it on small machines
+    _TOKENIZE_POOL = ThreadPoolExecutor(thread_name_prefix="tokenize")
+
+@app.on_event("shutdown")
+async def shutdown_tokenize_pool():
+    global _TOKENIZE_POOL
+    pool, _TOKENIZE_POOL = _TOKENIZE_POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False)
 
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok"}
 
+# Context window limits, sorted ascending by limit
+_MODEL_LIMITS = (
+    ("gpt-3.5-turbo", 4096),
+    ("gpt-4", 8192),
+    ("gpt-4-turbo", 128000),
+    ("claude-3-opus", 200000),
+)
+_LIMITS = [limit for _, limit in _MODEL_LIMITS]
+
 class TextRequest(BaseModel):
     text: str
     model: str = "gpt-3.5-turbo"
 
+class BatchTextRequest(BaseModel):
+    texts: List[str]
+    model: str = "gpt-3.5-turbo"
+
 class TokenResponse(BaseModel):
     count: int
     compatible_models: List[str]
@@ -48,50 +206,230 @@ class SplitRequest(BaseModel):
     chunk_size: int
     chunk_overlap: int
 
+class SplitTokenizeRequest(SplitRequest):
+    model: str = "gpt-3.5-turbo"
+
 class ProcessRequest(BaseModel):
     text: str
     api_key: Optional[str] = None
 
+# Dedicated pool for CPU-bound tokenize/split work. tiktoken releases the GIL
+# while encoding, so these threads really run in parallel. Created per
+# lifespan; until startup runs, the loop's default executor is used.
+_TOKENIZE_POOL: Optional[ThreadPoolExecutor] = None
+
+async def _run_in_pool(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_TOKENIZE_POOL, partial(func, *args, **kwargs))
+
+# Inputs larger than this are encoded as parallel shards
+_SHARD_CHARS = 1_000_000
+
+def _count_tokens(encoding, text: str) -> int:
+    # encode_ordinary skips the special-token scan; special tokens such as
+    # <|endoftext|> are counted as literal text, which is fine when counting
+    if len(text) <= _SHARD_CHARS:
+        return len(encoding.encode_ordinary(text))
+    # Cut shards at newlines so BPE merges across a boundary are rare
+    shards = []
+    start = 0
+    while start < len(text):
+        end = start + _SHARD_CHARS
+        if end < len(text):
+            cut = text.rfind("\n", start, end)
+            if cut > start:
+                end = cut + 1
+        shards.append(text[start:end])
+        start = end
+    token_lists = encoding.encode_ordinary_batch(shards, num_threads=os.cpu_count() or 1)
+    return sum(len(tokens) for tokens in token_lists)
+
+def _count_text(model: str, text: str) -> int:
+    # Runs on the tokenize pool, so a slow encoding load doesn't block the loop
+    return _count_tokens(_get_count_encoding(model), text)
+
+def _count_texts(model: str, texts: List[str]) -> List[int]:
+    # One encode_batch call tokenizes all texts across tiktoken's thread pool
+    encoding = _get_count_encoding(model)
+    token_lists = encoding.encode_ordinary_batch(texts, num_threads=os.cpu_count() or 1)
+    return [len(tokens) for tokens in token_lists]
+
+def _check_input_size(length: int):
+    # Reject oversized payloads before spending worker CPU on them
+    if length > MAX_INPUT_CHARS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Input too large: {length:,} characters (limit {MAX_INPUT_CHARS:,})"
+        )
+
+def _token_response(count: int) -> TokenResponse:
+    # Check compatibility: every model from the first limit >= count onwards
+    idx = bisect.bisect_left(_LIMITS, count)
+    compatible = [m for m, _ in _MODEL_LIMITS[idx:]]
+    return TokenResponse(count=count, compatible_models=compatible)
+
 @app.post("/api/tokenize", response_model=TokenResponse)
 async def count_tokens_endpoint(request: TextRequest):
-    try:
-        encoding = tiktoken.encoding_for_model(request.model)
-        tokens = encoding.encode(request.text)
-        count = len(tokens)
-        
-        # Check compatibility
-        models = {
-            "gpt-3.5-turbo": 4096,
-            "gpt-4": 8192,
-            "gpt-4-turbo": 128000,
-            "claude-3-opus": 200000
-        }
-        
-        compatible = [m for m, limit in models.items() if count <= limit]
-        
-        return TokenResponse(count=count, compatible_models=compatible)
-    except Exception as e:
-        # Fallback estimation
-        count = int(len(request.text.split()) * 1.3)
-        return TokenResponse(count=count, compatible_models=[])
+    _check_input_size(len(request.text))
+    # Encoding lookup (which may download BPE data) and encoding both run
+    # off the event loop
+    count = await _run_in_pool(_count_text, request.model, request.text)
+    
+    return _token_response(count)
+
+@app.post("/api/tokenize/batch", response_model=List[TokenResponse])
+async def count_tokens_batch_endpoint(request: BatchTextRequest):
+    _check_input_size(sum(len(text) for text in request.texts))
+    counts = await _run_in_pool(_count_texts, request.model, request.texts)
+    return [_token_response(count) for count in counts]
+
+def _merge_small_chunks(text: str, chunks: List[str], target: int, min_size: int, overlap: int) -> List[str]:
+    """Fold chunks shorter than min_size into a neighbour when the span fits in target
+
+    Full-size chunks are never merged with each other, so the paragraph and
+    sentence boundaries the splitter chose are kept. Chunks are located in the
+    source text and merged by slicing the original span, so overlap and
+    separators between them are kept exactly once.
+    """
+    if len(chunks) < 2:
+        return chunks
+    
+    spans = []
+    search_from = 0
+    for chunk in chunks:
+        start = text.find(chunk, search_from)
+        if start == -1:
+            start = text.find(chunk, spans[-1][0] + 1 if spans else 0)
+            if start == -1:
+                # Can't map chunks back onto the text; leave them as split
+                return chunks
+        spans.append((start, start + len(chunk)))
+        search_from = max(start + 1, start + len(chunk) - overlap)
+    
+    merged = []
+    cur_start, cur_end = spans[0]
+    for start, end in spans[1:]:
+        # Either side must be an undersized fragment for the pair to merge
+        small = end - start < min_size or cur_end - cur_start < min_size
+        if small and end - cur_start <= target:
+            cur_end = max(cur_end, end)
+        else:
+            merged.append(text[cur_start:cur_end])
+            cur_start, cur_end = start, end
+    merged.append(text[cur_start:cur_end])
+    return merged
+
+# Content-addressed LRU cache of split results for repeat requests, bounded by
+# the total characters of cached chunks (overlap included), per worker process
+_SPLIT_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_SPLIT_CACHE_MAX_CHARS = 4_000_000
+_split_cache_chars = 0
+_SPLIT_CACHE_LOCK = threading.Lock()
+
+def _split_cache_key(request: SplitRequest) -> tuple:
+    digest = hashlib.blake2b(request.text.encode("utf-8"), digest_size=16).digest()
+    return (digest, request.chunk_size, request.chunk_overlap)
+
+def _split_text(request: SplitRequest, cache_key: Optional[tuple] = None) -> List[str]:
+    if cache_key is None:
+        cache_key = _split_cache_key(request)
+    with _SPLIT_CACHE_LOCK:
+        cached = _SPLIT_CACHE.get(cache_key)
+        if cached is not None:
+            _SPLIT_CACHE.move_to_end(cache_key)
+            return cached[0]
+    
+    text_splitter = _get_splitter(request.chunk_size, request.chunk_overlap)
+    chunks = text_splitter.split_text(request.text)
+    # Second pass: fold undersized fragments back into their neighbours
+    chunks = _merge_small_chunks(
+        request.text,
+        chunks,
+        target=request.chunk_size,
+        min_size=request.chunk_size // 10,
+        overlap=request.chunk_overlap
+    )
+    
+    _cache_split(cache_key, chunks)
+    return chunks
+
+def _cache_split(cache_key: tuple, chunks: List[str]):
+    global _split_cache_chars
+    size = sum(len(chunk) for chunk in chunks)
+    if size > _SPLIT_CACHE_MAX_CHARS:
+        return
+    with _SPLIT_CACHE_LOCK:
+        if cache_key in _SPLIT_CACHE:
+            return
+        _SPLIT_CACHE[cache_key] = (chunks, size)
+        _split_cache_chars += size
+        # Evict least recently used entries until back under budget
+        while _split_cache_chars > _SPLIT_CACHE_MAX_CHARS:
+            _, (_, evicted_size) = _SPLIT_CACHE.popitem(last=False)
+            _split_cache_chars -= evicted_size
+
+# Yield to the event loop after this many streamed chunks
+_STREAM_YIELD_EVERY = 256
+
+async def _iter_split_json(chunks):
+    # Stream {"chunks": [...], "count": N} one chunk at a time instead of
+    # serializing the whole list into a single string first. orjson is much
+    # faster than the stdlib encoder for these large lists of strings.
+    yield b'{"chunks":['
+    for i, chunk in enumerate(chunks):
+        yield (b"," if i else b"") + orjson.dumps(chunk)
+        if i % _STREAM_YIELD_EVERY == _STREAM_YIELD_EVERY - 1:
+            await asyncio.sleep(0)
+    yield b'],"count":%d}' % len(chunks)
+
+async def _iter_split_ndjson(chunks):
+    # One {"chunk": ...} object per line, so clients can consume incrementally
+    for i, chunk in enumerate(chunks):
+        yield orjson.dumps({"chunk": chunk}) + b"\n"
+        if i % _STREAM_YIELD_EVERY == _STREAM_YIELD_EVERY - 1:
+            await asyncio.sleep(0)
 
 @app.post("/api/split")
-async def split_text_endpoint(request: SplitRequest):
+async def split_text_endpoint(request: SplitRequest, raw_request: Request):
+    _check_input_size(len(request.text))
+    ndjson = "application/x-ndjson" in raw_request.headers.get("accept", "")
+    
+    # Splitting (and hashing) is pure-Python CPU work; keep it off the event loop
+    cache_key = await _run_in_pool(_split_cache_key, request)
+    digest, chunk_size, chunk_overlap = cache_key
+    etag = f'"{digest.hex()}-{chunk_size}-{chunk_overlap}{"-ndjson" if ndjson else ""}"'
+    # Only advertised; conditional requests (304) apply to GET/HEAD, not POST
+    headers = {"ETag": etag, "Vary": "Accept"}
+    
     try:
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=request.chunk_size,
-            chunk_overlap=request.chunk_overlap,
-            length_function=len
-        )
-        chunks = text_splitter.split_text(request.text)
-        return {"chunks": chunks, "count": len(chunks)}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        chunks = await _run_in_pool(_split_text, request, cache_key)
+    except ValueError as e:
+        # Invalid splitter settings (e.g. overlap larger than chunk size)
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if ndjson:
+        return StreamingResponse(_iter_split_ndjson(chunks), media_type="application/x-ndjson", headers=headers)
+    return StreamingResponse(_iter_split_json(chunks), media_type="application/json", headers=headers)
+
+@app.post("/api/split_and_tokenize")
+async def split_and_tokenize_endpoint(request: SplitTokenizeRequest):
+    _check_input_size(len(request.text))
+    # Split and batch-tokenize off the event loop
+    try:
+        chunks = await _run_in_pool(_split_text, request)
+    except ValueError as e:
+        # Invalid splitter settings (e.g. overlap larger than chunk size)
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Outside the try: tokenizer failures (tiktoken raises ValueError for a
+    # bad BPE file too) are server errors and must surface as 500s
+    counts = await _run_in_pool(_count_texts, request.model, chunks)
+    return [{"text": chunk, "tokens": count} for chunk, count in zip(chunks, counts)]
 
 @app.post("/api/process")
 async def process_text_endpoint(request: ProcessRequest):
     # Check for key in request, then env, then fallback to hardcoded string (if user edited it)
-    api_key = request.api_key or os.getenv("OPENAI_API_KEY")
+    api_key = request.api_key or _ENV_OPENAI_KEY
     
     # If using the hardcoded key from user edit, handle it properly
     # (Checking if user pasted key into os.getenv directly like previous error)
@@ -103,13 +441,12 @@ async def process_text_endpoint(request: ProcessRequest):
     if not api_key:
          return {"summary": "Mock Summary: No API Key found. Please add it to .env or the text input.", "tokens_used": 0}
 
+    from langchain_community.callbacks import get_openai_callback
+    from langchain_core.messages import HumanMessage, SystemMessage
+
     try:
         # Initialize LLM
-        llm = ChatOpenAI(
-            temperature=0, 
-            model_name="gpt-3.5-turbo",
-            openai_api_key=api_key
-        )
+        llm = _get_env_llm() if api_key == _ENV_OPENAI_KEY else _create_llm(api_key)
         
         # Track token usage
         with get_openai_callback() as cb:
@@ -118,7 +455,7 @@ async def process_text_endpoint(request: ProcessRequest):
                 SystemMessage(content="You are a helpful assistant that summarizes text concisely."),
                 HumanMessage(content=f"Please provide a 2-sentence summary of the following text:\n\n{request.text}")
             ]
-            response = llm.invoke(messages)
+            response = await llm.ainvoke(messages)
             
             return {
                 "summary": response.content,
@@ -129,12 +466,46 @@ async def process_text_endpoint(request: ProcessRequest):
         # Return error as summary for visibility in UI
         return {"summary": f"Error calling OpenAI: {str(e)}", "tokens_used": 0}
 
-# Mount static files (Vite build output)
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for Vite's content-hashed assets, which can be cached forever"""
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+# Serve the SPA (Vite build output)
 # Must be after API routes to avoid blocking them
-if os.path.exists("frontend/dist"):
-    app.mount("/", StaticFiles(directory="frontend/dist", html=True), name="static")
+if _FRONTEND_DIR.exists():
+    _FRONTEND_ROOT = _FRONTEND_DIR.resolve()
+
+    if (_FRONTEND_DIR / "assets").is_dir():
+        app.mount("/assets", ImmutableStaticFiles(directory=_FRONTEND_DIR / "assets"), name="assets")
+
+    @app.api_route("/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+    async def spa(path: str):
+        if path.startswith("api/"):
+            raise HTTPException(status_code=404, detail="Not Found")
+        # Top-level build files (e.g. vite.svg) are served as-is
+        file_path = (_FRONTEND_ROOT / path).resolve()
+        if path and file_path.is_file() and _FRONTEND_ROOT in file_path.parents:
+            return FileResponse(file_path)
+        # Everything else gets the app shell, revalidated so new builds show up
+        return FileResponse(_FRONTEND_ROOT / "index.html", headers={"Cache-Control": "no-cache"})
 else:
     print("Warning: frontend/dist not found. Run 'npm run build' in frontend directory.")
 
 if __name__ == "__main__":
-    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
+    if os.getenv("DEV") == "1":
+        # Auto-reload only works with a single worker
+        uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        uvicorn.run(
+            "server:app",
+            host="0.0.0.0",
+            port=8000,
+            # CPU-bound tokenize/split work scales with processes, not threads
+            workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+            # "auto" uses uvloop when installed (it isn't available on Windows)
+            loop="auto",
+            http="httptools",
+        )